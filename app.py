@@ -1,24 +1,195 @@
 import streamlit as st
-import requests
-import json
 import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from fpdf import FPDF
+from openrouter import EmptyResponseError, chat, describe_image
 from io import BytesIO
-from PIL import Image
-import base64
 
 # Load environment variables
 load_dotenv()
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 LLAMA_MODEL = os.getenv("LLAMA_MODEL")
 VISION_MODEL = os.getenv("VISION_MODEL")
 
+# --- PROMPT TEMPLATES ---
+QUESTION_DISH = "What dish or food is shown in this image?"
+QUESTION_INGREDIENTS = "List all visible ingredients in this image."
+
+PROMPT_DISH_RECIPE = """
+You are an expert chef. Based on this dish name, generate a full recipe.
+
+Dish Name: {dish_name}
+
+Generate:
+1. Name of the dish
+2. List of required ingredients
+3. Step-by-step instructions
+4. Estimated cooking time
+5. Dietary notes (e.g., vegan, gluten-free if applicable)
+
+Make sure the recipe is safe to eat and matches the detected dish.
+"""
+
+DETECTED_INGREDIENTS_PREFS = ", ".join(["Vegetarian", "Vegan", "Gluten-Free", "Low-Carb"])
+
+# Tabs 2 and 3 request one recipe per call, each steered to a different style so the parallel results differ
+RECIPE_STYLES = [
+    "a quick and simple dish",
+    "a hearty main course",
+    "a light dish, salad or side"
+]
+RECIPE_HEADINGS = [f"### Recipe {i}" for i in range(1, len(RECIPE_STYLES) + 1)]
+
+PROMPT_DETECTED_INGREDIENTS = """
+You are an expert chef. Based on these ingredients, generate 1 creative recipe.
+Make it {style}.
+
+Ingredients: {ingredients}
+Dietary Preferences: {prefs}
+
+For the recipe:
+1. Name
+2. Ingredients
+3. Instructions
+4. Cooking time
+5. Substitution suggestions
+
+Ensure the recipe matches dietary preferences and is safe to eat.
+"""
+
+PROMPT_INGREDIENT_RECIPES = """
+You are an expert chef and assistant. Based on these ingredients and dietary preferences, generate 1 recipe.
+Make it {style}.
+
+Ingredients: {ingredients}
+Dietary Preferences: {prefs}
+
+For the recipe:
+1. Name of the dish
+2. List of ingredients needed
+3. Step-by-step instructions
+4. Estimated cooking time
+5. Notes on possible substitutions if ingredients are missing
+
+Ensure the recipe matches dietary preferences. If certain core ingredients are missing, adjust the recipe safely.
+"""
+
+DISH_VARIATIONS = [
+    "Original version",
+    "Adapted version using available ingredients",
+    "Alternate dish that can be made with similar flavor or theme"
+]
+
+PROMPT_DISH_VARIATION = """
+You are an expert chef and assistant. Provide a detailed recipe for '{dish_name}'.
+
+Available ingredients: {available}
+
+If key ingredients are missing, morph the recipe safely using common substitutes.
+Provide only this variation of the recipe: {variation}
+
+Include:
+- Ingredients needed
+- Step-by-step instructions
+- Estimated cooking time
+- Dietary notes if applicable
+- Safety note if substitutions were made
+
+Make sure the recipe would not harm someone eating it.
+"""
+
 # App Title
 st.set_page_config(page_title="Smart Recipe App", layout="wide")
 st.title("🍽️ Smart Recipe Generator")
 st.markdown("Upload an image of food or ingredients, or search by dish name to get custom recipes!")
 
+def user_message(prompt):
+    return [{"role": "user", "content": prompt}]
+
+RECIPE_SEPARATOR = "\n\n---\n\n"
+
+def write_parallel(model, prompts, headings, **kwargs):
+    # Stream the first prompt while the rest generate concurrently over the pooled session;
+    # returns the combined markdown of all replies
+    # No context manager: on error we must not wait for the remaining requests to finish
+    pool = ThreadPoolExecutor(max_workers=max(len(prompts) - 1, 1))
+    try:
+        futures = [pool.submit(chat, model, user_message(p), **kwargs) for p in prompts[1:]]
+        st.markdown(headings[0])
+        texts = [st.write_stream(chat(model, user_message(prompts[0]), stream=True, **kwargs))]
+        if not texts[0]:
+            raise EmptyResponseError("OpenRouter returned no content")
+        for heading, future in zip(headings[1:], futures):
+            st.markdown("---")
+            st.markdown(heading)
+            text = future.result()
+            if not text:
+                raise EmptyResponseError("OpenRouter returned no content")
+            texts.append(text)
+            st.markdown(text)
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return RECIPE_SEPARATOR.join(f"{heading}\n\n{text}" for heading, text in zip(headings, texts))
+
+MAX_IMAGE_SIDE = 1024  # px, long edge sent to the vision model
+JPEG_QUALITY = 85
+
+def prepare_upload(uploaded_file, widget_key):
+    # Reruns fire on every widget interaction; reuse the prepared JPEG while the same file stays uploaded
+    state_key = f"{widget_key}_prepared"
+    cached = st.session_state.get(state_key)
+    if cached and cached[0] == uploaded_file.file_id:
+        return cached[1], cached[2]
+
+    from PIL import Image, ImageOps
+
+    # Downscale and re-encode as JPEG: fewer bytes to upload and fewer image tokens to bill
+    uploaded_file.seek(0)
+    with BytesIO() as buf:
+        img = Image.open(uploaded_file)
+        # The re-encoded JPEG carries no EXIF, so bake the phone's orientation flag into the pixels
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.LANCZOS)
+        if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+            # JPEG has no alpha; flatten onto white so transparent areas don't turn black
+            rgba = img.convert("RGBA")
+            img = Image.new("RGB", rgba.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.getchannel("A"))
+        img.convert("RGB").save(buf, format="JPEG", quality=JPEG_QUALITY, optimize=True)
+        jpeg_bytes = buf.getvalue()
+
+    image_digest = hashlib.sha256(jpeg_bytes).hexdigest()
+    st.session_state[state_key] = (uploaded_file.file_id, jpeg_bytes, image_digest)
+    return jpeg_bytes, image_digest
+
+# --- PDF EXPORT ---
+# fpdf and PIL are imported where they are first needed to keep cold start fast
+@st.cache_resource(show_spinner=False)
+def get_pdf_class():
+    from fpdf import FPDF
+
+    class PDF(FPDF):
+        def header(self):
+            self.set_font('Arial', 'B', 12)
+            self.cell(0, 10, 'Generated Recipes', align='C', ln=1)
+            self.ln(5)
+
+    return PDF
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def build_pdf(recipe_text):
+    # Built in memory and cached per recipe, so reruns don't rebuild it or touch the disk
+    pdf = get_pdf_class()()
+    pdf.add_page()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.set_font("Arial", size=12)
+    # The core Arial font is Latin-1 only, so unsupported characters become "?"
+    safe_text = recipe_text.encode("latin-1", "replace").decode("latin-1")
+    pdf.multi_cell(0, 10, safe_text)
+
+    output = pdf.output(dest="S")
+    return output.encode("latin-1") if isinstance(output, str) else bytes(output)
+
 # Session state for storing results
 if "last_recipe" not in st.session_state:
     st.session_state["last_recipe"] = ""
@@ -38,85 +209,30 @@ with tab1:
     uploaded_file = st.file_uploader("Choose a dish image file", type=["jpg", "jpeg", "png"], key="dish_upload")
 
     if uploaded_file is not None:
-        image = Image.open(uploaded_file)
-        st.image(image, caption="Uploaded Dish Image", use_column_width=True)
+        st.image(uploaded_file, caption="Uploaded Dish Image", use_column_width=True)
 
-        # Convert image to base64
-        img_bytes = BytesIO(uploaded_file.getvalue()).getbuffer()
-        encoded_image = base64.b64encode(img_bytes).decode("utf-8")
-        image_url = f"data:image/jpeg;base64,{encoded_image}"
+        jpeg_bytes, image_digest = prepare_upload(uploaded_file, "dish_upload")
 
         if st.button("Detect Dish & Generate Recipe"):
             with st.spinner("Analyzing image..."):
 
                 # Step 1: Use vision model to detect dish name
                 try:
-                    response = requests.post(
-                        url="https://openrouter.ai/api/v1/chat/completions", 
-                        headers={
-                            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                            "Content-Type": "application/json"
-                        },
-                        data=json.dumps({
-                            "model": VISION_MODEL,
-                            "messages": [
-                                {
-                                    "role": "user",
-                                    "content": [
-                                        {"type": "text", "text": "What dish or food is shown in this image?"},
-                                        {"type": "image_url", "image_url": {"url": image_url}}
-                                    ]
-                                }
-                            ],
-                            "temperature": 0.5,
-                            "max_tokens": 300
-                        })
-                    )
-
-                    result = response.json()
-                    if result.get("choices") and len(result["choices"]) > 0:
-                        dish_name = result["choices"][0]["message"]["content"]
-
+                    try:
+                        dish_name = describe_image(VISION_MODEL, QUESTION_DISH, image_digest, jpeg_bytes)
+                    except EmptyResponseError:
+                        dish_name = None
+                    if dish_name:
                         st.success("Detected Dish:")
                         st.write(dish_name)
 
                         # Step 2: Use LLaMA to generate recipe for the detected dish
-                        prompt = f"""
-You are an expert chef. Based on this dish name, generate a full recipe.
-
-Dish Name: {dish_name}
-
-Generate:
-1. Name of the dish
-2. List of required ingredients
-3. Step-by-step instructions
-4. Estimated cooking time
-5. Dietary notes (e.g., vegan, gluten-free if applicable)
-
-Make sure the recipe is safe to eat and matches the detected dish.
-"""
+                        prompt = PROMPT_DISH_RECIPE.format(dish_name=dish_name)
 
                         try:
-                            response = requests.post(
-                                url="https://openrouter.ai/api/v1/chat/completions", 
-                                headers={
-                                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                                    "Content-Type": "application/json"
-                                },
-                                data=json.dumps({
-                                    "model": LLAMA_MODEL,
-                                    "messages": [{"role": "user", "content": prompt}],
-                                    "temperature": 0.7,
-                                    "max_tokens": 1200
-                                })
-                            )
-
-                            data = response.json()
-                            recipe_text = data["choices"][0]["message"]["content"]
-                            st.session_state["last_recipe"] = recipe_text
-
                             st.subheader("Generated Recipe Based on Dish Image:")
-                            st.markdown(recipe_text)
+                            recipe_text = st.write_stream(chat(LLAMA_MODEL, user_message(prompt), stream=True))
+                            st.session_state["last_recipe"] = recipe_text
 
                         except Exception as e:
                             st.error(f"Error generating recipe: {str(e)}")
@@ -133,90 +249,35 @@ with tab2:
     uploaded_file = st.file_uploader("Choose ingredients image file", type=["jpg", "jpeg", "png"], key="ingredient_upload")
 
     if uploaded_file is not None:
-        image = Image.open(uploaded_file)
-        st.image(image, caption="Uploaded Ingredients", use_column_width=True)
+        st.image(uploaded_file, caption="Uploaded Ingredients", use_column_width=True)
 
-        # Convert image to base64
-        img_bytes = BytesIO(uploaded_file.getvalue()).getbuffer()
-        encoded_image = base64.b64encode(img_bytes).decode("utf-8")
-        image_url = f"data:image/jpeg;base64,{encoded_image}"
+        jpeg_bytes, image_digest = prepare_upload(uploaded_file, "ingredient_upload")
 
         if st.button("Detect Ingredients & Generate Recipes"):
             with st.spinner("Analyzing image..."):
 
                 # Step 1: Use vision model to detect ingredients
                 try:
-                    response = requests.post(
-                        url="https://openrouter.ai/api/v1/chat/completions", 
-                        headers={
-                            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                            "Content-Type": "application/json"
-                        },
-                        data=json.dumps({
-                            "model": VISION_MODEL,
-                            "messages": [
-                                {
-                                    "role": "user",
-                                    "content": [
-                                        {"type": "text", "text": "List all visible ingredients in this image."},
-                                        {"type": "image_url", "image_url": {"url": image_url}}
-                                    ]
-                                }
-                            ],
-                            "temperature": 0.5,
-                            "max_tokens": 300
-                        })
-                    )
-
-                    result = response.json()
-                    if result.get("choices") and len(result["choices"]) > 0:
-                        ingredients = result["choices"][0]["message"]["content"]
+                    try:
+                        ingredients = describe_image(VISION_MODEL, QUESTION_INGREDIENTS, image_digest, jpeg_bytes)
+                    except EmptyResponseError:
+                        ingredients = None
+                    if ingredients:
                         st.session_state["detected_ingredients"] = ingredients
 
                         st.success("Detected Ingredients:")
                         st.write(ingredients)
 
                         # Step 2: Use LLaMA to generate recipes from detected ingredients
-                        dietary_preferences = ["Vegetarian", "Vegan", "Gluten-Free", "Low-Carb"]
-                        preferences_str = ", ".join(dietary_preferences)
-
-                        prompt = f"""
-You are an expert chef. Based on these ingredients, generate 3 creative recipes.
-
-Ingredients: {ingredients}
-Dietary Preferences: {preferences_str}
-
-For each recipe:
-1. Name
-2. Ingredients
-3. Instructions
-4. Cooking time
-5. Substitution suggestions
-
-Ensure recipes match dietary preferences and are safe to eat.
-"""
+                        prompts = [
+                            PROMPT_DETECTED_INGREDIENTS.format(style=style, ingredients=ingredients, prefs=DETECTED_INGREDIENTS_PREFS)
+                            for style in RECIPE_STYLES
+                        ]
 
                         try:
-                            response = requests.post(
-                                url="https://openrouter.ai/api/v1/chat/completions", 
-                                headers={
-                                    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                                    "Content-Type": "application/json"
-                                },
-                                data=json.dumps({
-                                    "model": LLAMA_MODEL,
-                                    "messages": [{"role": "user", "content": prompt}],
-                                    "temperature": 0.7,
-                                    "max_tokens": 1200
-                                })
-                            )
-
-                            data = response.json()
-                            recipe_text = data["choices"][0]["message"]["content"]
-                            st.session_state["last_recipe"] = recipe_text
-
                             st.subheader("Recipes You Can Make with These Ingredients:")
-                            st.markdown(recipe_text)
+                            recipe_text = write_parallel(LLAMA_MODEL, prompts, RECIPE_HEADINGS, max_tokens=450)
+                            st.session_state["last_recipe"] = recipe_text
 
                         except Exception as e:
                             st.error(f"Error generating recipes: {str(e)}")
@@ -241,42 +302,16 @@ with tab3:
         if not ingredients.strip():
             st.error("Please enter at least one ingredient.")
         else:
-            prompt = f"""
-You are an expert chef and assistant. Based on these ingredients and dietary preferences, generate 3 recipes.
-
-Ingredients: {ingredients}
-Dietary Preferences: {preferences_str}
-
-For each recipe:
-1. Name of the dish
-2. List of ingredients needed
-3. Step-by-step instructions
-4. Estimated cooking time
-5. Notes on possible substitutions if ingredients are missing
-
-Ensure all recipes match dietary preferences. If certain core ingredients are missing, adjust the recipe safely.
-"""
+            # One request per recipe so OpenRouter generates them in parallel
+            prompts = [
+                PROMPT_INGREDIENT_RECIPES.format(style=style, ingredients=ingredients, prefs=preferences_str)
+                for style in RECIPE_STYLES
+            ]
 
             try:
-                response = requests.post(
-                    url="https://openrouter.ai/api/v1/chat/completions", 
-                    headers={
-                        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                        "Content-Type": "application/json"
-                    },
-                    data=json.dumps({
-                        "model": LLAMA_MODEL,
-                        "messages": [{"role": "user", "content": prompt}],
-                        "temperature": 0.7,
-                        "max_tokens": 1200
-                    })
-                )
-                data = response.json()
-                recipe_text = data["choices"][0]["message"]["content"]
-                st.session_state["last_recipe"] = recipe_text
-
                 st.subheader("Here are your 3 recipe suggestions:")
-                st.markdown(recipe_text)
+                recipe_text = write_parallel(LLAMA_MODEL, prompts, RECIPE_HEADINGS, max_tokens=450)
+                st.session_state["last_recipe"] = recipe_text
 
             except Exception as e:
                 st.error(f"An error occurred: {str(e)}")
@@ -291,47 +326,18 @@ with tab4:
         if not dish_name.strip():
             st.error("Please enter a dish name.")
         else:
-            prompt = f"""
-You are an expert chef and assistant. Provide a detailed recipe for '{dish_name}'.
-
-Available ingredients: {ingredients_override or 'Assume full access'}
-
-If key ingredients are missing, morph the recipe safely using common substitutes.
-Always provide 3 variations of the recipe:
-1. Original version
-2. Adapted version using available ingredients
-3. Alternate dish that can be made with similar flavor or theme
-
-Include:
-- Ingredients needed
-- Step-by-step instructions
-- Estimated cooking time
-- Dietary notes if applicable
-- Safety note if substitutions were made
-
-Make sure none of the recipes would harm someone eating them.
-"""
+            # One request per variation so OpenRouter generates them in parallel
+            available = ingredients_override or "Assume full access"
+            prompts = [
+                PROMPT_DISH_VARIATION.format(dish_name=dish_name, available=available, variation=variation)
+                for variation in DISH_VARIATIONS
+            ]
 
             try:
-                response = requests.post(
-                    url="https://openrouter.ai/api/v1/chat/completions", 
-                    headers={
-                        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-                        "Content-Type": "application/json"
-                    },
-                    data=json.dumps({
-                        "model": LLAMA_MODEL,
-                        "messages": [{"role": "user", "content": prompt}],
-                        "temperature": 0.7,
-                        "max_tokens": 1200
-                    })
-                )
-                data = response.json()
-                recipe_text = data["choices"][0]["message"]["content"]
-                st.session_state["last_recipe"] = recipe_text
-
                 st.subheader(f"Recipes related to '{dish_name}':")
-                st.markdown(recipe_text)
+                headings = [f"### {i}. {variation}" for i, variation in enumerate(DISH_VARIATIONS, start=1)]
+                recipe_text = write_parallel(LLAMA_MODEL, prompts, headings, max_tokens=450)
+                st.session_state["last_recipe"] = recipe_text
 
             except Exception as e:
                 st.error(f"An error occurred: {str(e)}")
@@ -342,23 +348,13 @@ with tab5:
     if st.session_state["last_recipe"]:
         st.markdown(st.session_state["last_recipe"])
 
-        class PDF(FPDF):
-            def header(self):
-                self.set_font('Arial', 'B', 12)
-                self.cell(0, 10, 'Generated Recipes', align='C', ln=1)
-                self.ln(5)
-
-        pdf = PDF()
-        pdf.add_page()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.set_font("Arial", size=12)
-        for line in st.session_state["last_recipe"].split('\n'):
-            pdf.cell(0, 10, txt=line, ln=1)
-
-        pdf_output = "recipes_export.pdf"
-        pdf.output(pdf_output)
+        # Every rerun (including the one that generates a recipe) executes this tab,
+        # so only build the PDF once the user asks for it.
+        if st.button("Prepare PDF"):
+            st.session_state["pdf_recipe"] = st.session_state["last_recipe"]
 
-        with open(pdf_output, "rb") as f:
-            st.download_button("📥 Download PDF", f, file_name="recipes_export.pdf", mime="application/pdf")
+        if st.session_state.get("pdf_recipe") == st.session_state["last_recipe"]:
+            pdf_bytes = build_pdf(st.session_state["last_recipe"])
+            st.download_button("📥 Download PDF", pdf_bytes, file_name="recipes_export.pdf", mime="application/pdf")
     else:
         st.info("Generate some recipes first before exporting.")
\ No newline at end of file
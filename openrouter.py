@@ -0,0 +1,174 @@
+import streamlit as st
+import requests
+import json
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import os
+import base64
+import time
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+
+# --- OPENROUTER CONNECTION ---
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+HEADERS = {
+    "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+    "Content-Type": "application/json"
+}
+REQUEST_TIMEOUT = (5, 60)  # (connect, read) seconds
+
+@st.cache_resource(show_spinner=False)
+def get_session():
+    # One pooled keep-alive session per process so every call reuses the TLS connection
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=20,
+        max_retries=Retry(total=2, backoff_factor=0.3)
+    )
+    session.mount("https://", adapter)
+    return session
+
+SESSION = get_session()
+
+@st.cache_resource(show_spinner=False)
+def warm_connection():
+    # Open the TLS connection once per process so the first user click finds it in the pool.
+    # Runs in the background so a slow or offline network never delays the first render.
+    def ping():
+        try:
+            SESSION.head("https://openrouter.ai/", timeout=REQUEST_TIMEOUT)
+        except requests.RequestException:
+            pass
+
+    thread = threading.Thread(target=ping, daemon=True)
+    thread.start()
+    return thread
+
+warm_connection()
+
+# --- RESPONSE CACHE ---
+# Completions are cached by (model, messages, temperature, max_tokens) so repeat clicks skip the API.
+# A plain dict is used instead of st.cache_data because streamed responses are only known once finished.
+CACHE_TTL = 3600  # seconds
+CACHE_MAX_ENTRIES = 256
+
+@st.cache_resource(show_spinner=False)
+def get_completion_cache():
+    return {"entries": {}, "lock": threading.Lock()}
+
+def cache_get(key):
+    cache = get_completion_cache()
+    with cache["lock"]:
+        entry = cache["entries"].get(key)
+    if entry and time.monotonic() - entry[0] < CACHE_TTL:
+        return entry[1]
+    return None
+
+def cache_put(key, text):
+    cache = get_completion_cache()
+    with cache["lock"]:
+        cache["entries"][key] = (time.monotonic(), text)
+        while len(cache["entries"]) > CACHE_MAX_ENTRIES:
+            cache["entries"].pop(next(iter(cache["entries"])))
+
+# --- CHAT COMPLETIONS ---
+class EmptyResponseError(RuntimeError):
+    pass
+
+def sse_iter(response, status):
+    # OpenRouter streams Server-Sent Events; keep-alive comments (": ...") are skipped.
+    # status["finished"] is set once [DONE] or a finish_reason arrives, so truncated streams are detectable.
+    for line in response.iter_lines():
+        if not line.startswith(b"data: "):
+            continue
+        payload = line[6:]
+        if payload == b"[DONE]":
+            status["finished"] = True
+            break
+        chunk = json.loads(payload)
+        if "error" in chunk:
+            raise RuntimeError(chunk["error"].get("message", "Streaming error"))
+        choice = chunk["choices"][0]
+        if choice.get("finish_reason"):
+            status["finished"] = True
+        yield choice["delta"].get("content") or ""
+
+def _complete(payload, key):
+    if key is not None:
+        cached = cache_get(key)
+        if cached is not None:
+            return cached
+
+    response = SESSION.post(OPENROUTER_URL, headers=HEADERS, json=payload, timeout=REQUEST_TIMEOUT)
+    data = response.json()
+    if "error" in data:
+        raise RuntimeError(data["error"].get("message", "OpenRouter request failed"))
+    text = (data.get("choices") or [{}])[0].get("message", {}).get("content")
+    if not text:
+        # Raise rather than return None so st.cache_data / the completion cache never store it
+        raise EmptyResponseError("OpenRouter returned no content")
+
+    if key is not None:
+        cache_put(key, text)
+    return text
+
+def _stream(payload, key):
+    if key is not None:
+        cached = cache_get(key)
+        if cached is not None:
+            yield cached
+            return
+
+    parts = []
+    status = {"finished": False}
+    with SESSION.post(
+        OPENROUTER_URL,
+        headers=HEADERS,
+        json=payload,
+        timeout=REQUEST_TIMEOUT,
+        stream=True
+    ) as response:
+        response.raise_for_status()
+        for part in sse_iter(response, status):
+            parts.append(part)
+            yield part
+
+    text = "".join(parts)
+    # Only complete, non-empty replies are cached; blank or cut-off streams are retried next time
+    if key is not None and text and status["finished"]:
+        cache_put(key, text)
+
+def chat(model, messages, temperature=0.7, max_tokens=1200, stream=False, cache=True):
+    # Returns the reply text, or a generator of text chunks when stream=True
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": stream
+    }
+    key = (model, json.dumps(messages), temperature, max_tokens) if cache else None
+    if stream:
+        return _stream(payload, key)
+    return _complete(payload, key)
+
+@st.cache_data(ttl=CACHE_TTL, show_spinner=False)
+def describe_image(model, question, image_digest, _jpeg_bytes):
+    # Keyed on the image digest; the image bytes are excluded from hashing and only
+    # base64-encoded on a cache miss, since OpenRouter accepts images as URLs or data URIs
+    image_url = f"data:image/jpeg;base64,{base64.b64encode(_jpeg_bytes).decode('ascii')}"
+    messages = [
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": question},
+                {"type": "image_url", "image_url": {"url": image_url}}
+            ]
+        }
+    ]
+    return chat(model, messages, temperature=0.5, max_tokens=300, cache=False)